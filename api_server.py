@@ -4,22 +4,56 @@ Thermal Camera API Server
 Runs on your laptop to receive thermal data from ESP32
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import json
+import base64
+import gzip
+import logging
 from datetime import datetime
 import os
+import queue
+import struct
+import threading
+import zlib
 from pathlib import Path
 from collections import Counter
+from functools import lru_cache
 import numpy as np
-from scipy.ndimage import label
+import orjson
+from scipy.ndimage import label, generate_binary_structure
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Anything Flask serializes itself (error handlers, request.get_json)
+    goes through orjson, which handles NumPy scalars and arrays natively.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for ESP32 requests
+app.json = OrjsonProvider(app)
+# CORS only on the API routes; max_age lets browsers cache the preflight
+# for a day instead of re-issuing OPTIONS round-trips
+CORS(app, resources={r"/api/*": {"origins": "*"}}, methods=["GET", "POST"], max_age=86400)
+
+# Per-request logging is DEBUG so the steady-state POST/GET path does no
+# string formatting at the default INFO level
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Configuration
 DATA_DIR = Path("thermal_data")  # Directory to save thermal data files
 SAVE_DATA = True  # Set to False to disable saving to disk
+FRAME_LOG_BINARY = True  # Set to False to keep frames in the daily JSONL instead
 
 # Occupancy detection parameters
 MIN_HUMAN_TEMP = 30.0  # Minimum temperature to consider as human (°C)
@@ -27,66 +61,227 @@ MAX_HUMAN_TEMP = 45.0  # Maximum temperature to consider as human (°C)
 MIN_CLUSTER_SIZE = 3   # Minimum number of connected pixels to count as a person
 MAX_CLUSTER_SIZE = 200 # Maximum cluster size (to filter out large hot objects)
 ROOM_TEMP_THRESHOLD = 0.5  # Temperature difference from median to consider as background
+CLUSTER_CONNECTIVITY = 2   # 2 = 8-connected (diagonals count), 1 = 4-connected (faster)
+
+# Precomputed once; was np.ones((3, 3)) rebuilt on every frame
+_CONN = generate_binary_structure(2, CLUSTER_CONNECTIVITY)
 
 # Store the latest thermal data
 latest_thermal_data = None
 last_update_time = None
 latest_occupancy = None  # Store latest occupancy estimate
-_data_counter = 0  # Counter for sequential file naming
+
+# Latest GET /api/thermal response as one immutable snapshot
+# (body_bytes, body_gz, update_time). Readers grab a single reference -
+# atomic in CPython - so they can never see a body paired with a stale
+# timestamp; the lock only serializes writers.
+_response_state = None
+_state_lock = threading.Lock()
 
 # Create data directory if it doesn't exist
 if SAVE_DATA:
     DATA_DIR.mkdir(exist_ok=True)
     print(f"Thermal data will be saved to: {DATA_DIR.absolute()}")
 
+# Per-quartile (slope, intercept) pairs for the r, g, b channels, applied
+# as channel = int((slope * normalized + intercept) * 255)
+_SEG = (
+    (0.0, 0.0, 4.0, 0.0, 0.0, 1.0),    # [0.00, 0.25): blue -> cyan
+    (0.0, 0.0, 0.0, 1.0, -4.0, 2.0),   # [0.25, 0.50): cyan -> green
+    (4.0, -2.0, 0.0, 1.0, 0.0, 0.0),   # [0.50, 0.75): green -> yellow
+    (0.0, 1.0, -4.0, 4.0, 0.0, 0.0),   # [0.75, 1.00]: yellow -> red
+)
+
 def temperature_to_color(temp, min_temp, max_temp):
-    """Convert temperature to RGB color - server-side color mapping."""
-    temp = max(min_temp, min(max_temp, temp))
-    
+    """Convert a single temperature to RGB - scalar diagnostic path.
+
+    Whole frames go through the vectorized COLORMAP; this per-value
+    fallback buckets the normalized temperature into its quartile and
+    applies the segment's linear coefficients from _SEG, replacing the
+    old four-way compare-and-branch chain.
+    """
     if max_temp == min_temp:
         return (128, 128, 128)
-    
+
+    temp = max(min_temp, min(max_temp, temp))
     normalized = (temp - min_temp) / (max_temp - min_temp)
-    
-    if normalized < 0.25:
-        r, g, b = 0, int(normalized * 4 * 255), 255
-    elif normalized < 0.5:
-        r, g, b = 0, 255, int((1 - (normalized - 0.25) * 4) * 255)
-    elif normalized < 0.75:
-        r, g, b = int((normalized - 0.5) * 4 * 255), 255, 0
-    else:
-        r, g, b = 255, int((1 - (normalized - 0.75) * 4) * 255), 0
-    
-    return (r, g, b)
+
+    seg = int(normalized * 4)
+    ra, rb, ga, gb, ba, bb = _SEG[3 if seg > 3 else seg]
+    return (
+        int((ra * normalized + rb) * 255),
+        int((ga * normalized + gb) * 255),
+        int((ba * normalized + bb) * 255)
+    )
+
+def _build_colormap():
+    """Build the 256-entry (256, 3) uint8 colormap lookup table.
+
+    The quantized index already encodes the frame's [min, max] range, so a
+    single table serves every frame regardless of temperature span.
+    """
+    n = np.linspace(0.0, 1.0, 256, dtype=np.float32)
+    # Same blue->cyan->green->yellow->red ramp as temperature_to_color,
+    # but in closed form: each channel is one clipped linear expression
+    # over the whole range instead of four masked segment passes.
+    #   r ramps up over [0.50, 0.75], g up over [0, 0.25] and down over
+    #   [0.75, 1], b down over [0.25, 0.50]
+    r = np.clip(4 * n - 2, 0, 1)
+    g = np.clip(np.minimum(4 * n, 4 - 4 * n), 0, 1)
+    b = np.clip(2 - 4 * n, 0, 1)
+    return (np.stack([r, g, b], axis=-1) * 255).astype(np.uint8)
+
+
+# Built once at import; a 768-byte table that stays cache-resident
+COLORMAP = _build_colormap()
+
+
+def colorize(q, out=None):
+    """Map quantized uint8 temperature indices to RGB via the colormap.
+
+    With `out`, the gather writes straight into the caller's buffer
+    (e.g. the RGB planes of a pooled RGBA frame) with no intermediate.
+    """
+    if out is not None:
+        np.take(COLORMAP, q, axis=0, out=out)
+        return out
+    return COLORMAP[q]
+
+
+@lru_cache(maxsize=4)
+def _frame_spec(width, height):
+    """Shape-specialized constants for expand_thermal_data.
+
+    The sensor grid is fixed per deployment (32x24 for the MLX90640), so
+    hoist everything derivable from (width, height) out of the per-frame
+    path: the pixel count and the fully precomputed flat-frame payload.
+    """
+    n_pixels = width * height
+    # Flat frame - same gray as the scalar colormap
+    flat = np.full((n_pixels, 4), 255, dtype=np.uint8)
+    flat[:, :3] = 128
+    return n_pixels, base64.b64encode(flat.tobytes()).decode()
+
+
+# Reusable RGBA output buffers, one per worker thread (waitress runs the
+# handlers on a thread pool) so steady-state frames allocate nothing
+_thread_bufs = threading.local()
+
+
+def _rgba_buffer(n_pixels):
+    """Return this thread's reusable (n_pixels, 4) uint8 RGBA buffer."""
+    bufs = getattr(_thread_bufs, 'rgba', None)
+    if bufs is None:
+        bufs = _thread_bufs.rgba = {}
+    buf = bufs.get(n_pixels)
+    if buf is None:
+        buf = bufs[n_pixels] = np.empty((n_pixels, 4), dtype=np.uint8)
+        buf[:, 3] = 255  # Alpha never changes
+    return buf
+
+
+def _label_buffer(shape):
+    """Return this thread's reusable int32 label buffer for `shape`.
+
+    int32 halves the bandwidth of scipy's default int64 label output and
+    is plenty for a 768-pixel grid.
+    """
+    bufs = getattr(_thread_bufs, 'labels', None)
+    if bufs is None:
+        bufs = _thread_bufs.labels = {}
+    buf = bufs.get(shape)
+    if buf is None:
+        buf = bufs[shape] = np.empty(shape, dtype=np.int32)
+    return buf
+
+
+def _bool_buffers(shape):
+    """Return this thread's reusable (mask, scratch) boolean buffers."""
+    bufs = getattr(_thread_bufs, 'bools', None)
+    if bufs is None:
+        bufs = _thread_bufs.bools = {}
+    pair = bufs.get(shape)
+    if pair is None:
+        pair = bufs[shape] = (np.empty(shape, dtype=bool), np.empty(shape, dtype=bool))
+    return pair
+
+
+def _f32_scratch(size):
+    """Return this thread's reusable flat float32 scratch of `size`."""
+    bufs = getattr(_thread_bufs, 'f32', None)
+    if bufs is None:
+        bufs = _thread_bufs.f32 = {}
+    buf = bufs.get(size)
+    if buf is None:
+        buf = bufs[size] = np.empty(size, dtype=np.float32)
+    return buf
+
+
+def dequantize_thermal_data(data):
+    """Expand an int8-quantized frame ('q') into compact format ('t').
+
+    The ESP32 sends temperatures as base64 uint8 values quantized over
+    the frame's [min, max] range; the inverse is
+    t = min + q * (max - min) / 255. Returns a new dict with a float32
+    't' array so the rest of the pipeline sees the usual compact format.
+    """
+    q = np.frombuffer(base64.b64decode(data['q']), dtype=np.uint8)
+    min_temp = data['min']
+    step = np.float32((data['max'] - min_temp) / 255.0)
+    data = dict(data)
+    del data['q']
+    data['t'] = min_temp + q.astype(np.float32) * step
+    return data
+
 
 def expand_thermal_data(compact_data):
-    """Expand compact temperature data into full pixel array with colors."""
+    """Expand compact temperature data into a colormapped RGBA buffer.
+
+    Temperatures are quantized to uint8 over the frame's [min, max] range
+    and colors come from a single COLORMAP gather - no per-pixel Python at
+    all.
+    """
     width = compact_data['w']
     height = compact_data['h']
     min_temp = compact_data['min']
     max_temp = compact_data['max']
-    temps = compact_data['t']
-    
-    pixels = []
-    for i, temp in enumerate(temps):
-        row = i // width
-        col = i % width
-        r, g, b = temperature_to_color(temp, min_temp, max_temp)
-        pixels.append({
-            "row": row,
-            "col": col,
-            "temp": temp,
-            "r": r,
-            "g": g,
-            "b": b
-        })
-    
+
+    # Validate the claimed grid against the actual payload before
+    # anything allocates from it: w/h come straight off the wire, and
+    # _frame_spec below sizes (and lru_cache-retains) a w*h buffer, so
+    # an inflated claim on a tiny payload must be rejected first
+    # np.array (not asarray) so binary frames that arrive as float32
+    # arrays still get a private copy we can quantize in place
+    temps = np.array(compact_data['t'], dtype=np.float32)
+    if temps.size != width * height:
+        raise ValueError(f"Expected {width * height} temperatures, got {temps.size}")
+
+    n_pixels, flat_b64 = _frame_spec(width, height)
+
+    if max_temp == min_temp:
+        rgba_b64 = flat_b64
+    else:
+        # In-place float32 quantization on the private copy
+        scale = 255.0 / (max_temp - min_temp)
+        np.subtract(temps, min_temp, out=temps)
+        np.multiply(temps, scale, out=temps)
+        np.clip(temps, 0, 255, out=temps)
+
+        # Pack the channels as interleaved RGBA bytes (alpha=255) so the
+        # browser can blit the whole frame with putImageData instead of
+        # per-pixel fillRect. ~7 bytes/pixel on the wire vs ~40 for the
+        # old per-pixel JSON dicts. The LUT gather writes directly into
+        # the pooled buffer's RGB planes.
+        rgba_arr = _rgba_buffer(n_pixels)
+        colorize(temps.astype(np.uint8), out=rgba_arr[:, :3])
+        rgba_b64 = base64.b64encode(rgba_arr.tobytes()).decode()
+
     return {
         "width": width,
         "height": height,
         "min_temp": min_temp,
         "max_temp": max_temp,
-        "pixels": pixels
+        "rgba_b64": rgba_b64
     }
 
 def thermal_data_to_array(data):
@@ -96,64 +291,109 @@ def thermal_data_to_array(data):
         width = data['w']
         height = data['h']
         temps = data['t']
+        if not isinstance(temps, np.ndarray):
+            # JSON path: fill the float32 array in one pass instead of
+            # letting np.array build an object intermediate from the list
+            temps = np.fromiter(temps, dtype=np.float32, count=width * height)
     elif 'pixels' in data:
-        # Expanded format: pixels array
+        # Legacy expanded format: pixels array. Pull the temps straight
+        # into a NumPy array without building an intermediate list.
         width = data['width']
         height = data['height']
-        temps = [p['temp'] for p in data['pixels']]
+        temps = np.fromiter((p['temp'] for p in data['pixels']),
+                            dtype=np.float32, count=width * height)
     else:
         raise ValueError("Unknown thermal data format")
     
-    # Reshape flat array to 2D grid
-    temp_array = np.array(temps).reshape((height, width))
+    # Reshape flat array to 2D grid; float32 keeps every downstream op at
+    # half the bandwidth of the float64 default
+    temp_array = np.asarray(temps, dtype=np.float32).reshape((height, width))
     return temp_array
 
 def estimate_room_temperature(temp_array):
     """Estimate room/background temperature from thermal data."""
-    # Use median temperature as room temperature estimate
-    # This filters out hot spots (people) and cold spots
-    return np.median(temp_array)
+    # Median temperature filters out hot spots (people) and cold spots.
+    # O(n) quickselect via in-place partition of a reused scratch copy
+    # instead of np.median's sort-and-allocate; the upper-middle element
+    # alone is close enough for a background estimate (exact even-length
+    # medians average two neighboring bins)
+    flat = temp_array.ravel()
+    k = flat.size // 2
+    scratch = _f32_scratch(flat.size)
+    np.copyto(scratch, flat)
+    scratch.partition(k)
+    return scratch[k]
 
 def detect_human_heat(temp_array, room_temp):
-    """Create a binary mask of pixels that likely contain human body heat."""
-    # Method 1: Absolute temperature threshold
-    human_mask = (temp_array >= MIN_HUMAN_TEMP) & (temp_array <= MAX_HUMAN_TEMP)
-    
-    # Method 2: Relative to room temperature (warmer than room by threshold)
-    temp_diff = temp_array - room_temp
-    relative_mask = temp_diff >= ROOM_TEMP_THRESHOLD
-    
-    # Combine both methods (must satisfy both)
-    combined_mask = human_mask & relative_mask
-    
-    return combined_mask.astype(int)
+    """Create a binary mask of pixels that likely contain human body heat.
+
+    Three conditions ANDed in place across two boolean buffers: inside
+    the absolute human band, and warmer than the room by the threshold
+    (folded to t >= room_temp + threshold, skipping the subtraction
+    array entirely). Returns a uint8 view ready for the labeling pass.
+    """
+    mask, scratch = _bool_buffers(temp_array.shape)
+    np.greater_equal(temp_array, MIN_HUMAN_TEMP, out=mask)
+    np.less_equal(temp_array, MAX_HUMAN_TEMP, out=scratch)
+    mask &= scratch
+
+    np.greater_equal(temp_array, room_temp + ROOM_TEMP_THRESHOLD, out=scratch)
+    mask &= scratch
+
+    return mask.view(np.uint8)
+
+@lru_cache(maxsize=4)
+def _coord_grids(shape):
+    """Flattened row/col index grids for a sensor shape (read-only)."""
+    rows, cols = np.indices(shape)
+    return rows.ravel().astype(np.float64), cols.ravel().astype(np.float64)
+
 
 def find_people_clusters(human_mask):
     """Find connected clusters of warm pixels and count them as people."""
-    # Use connected components labeling
-    # Structure defines connectivity (8-connected: includes diagonals)
-    structure = np.ones((3, 3), dtype=int)
-    labeled_array, num_features = label(human_mask, structure=structure)
-    
-    # Filter clusters by size
+    # Use connected components labeling; connectivity comes from the
+    # precomputed _CONN structure and labels land in a reused buffer
+    labeled_array = _label_buffer(human_mask.shape)
+    num_features = label(human_mask, structure=_CONN, output=labeled_array)
+    if num_features == 0:
+        return []
+
+    # Sizes and centroid sums all come from bincount passes over the
+    # label image - the per-component stats cv2.connectedComponentsWithStats
+    # would give, without adding OpenCV as a dependency
+    flat = labeled_array.ravel()
+    sizes = np.bincount(flat, minlength=num_features + 1)
+    valid_ids = np.where(
+        (sizes[1:] >= MIN_CLUSTER_SIZE) & (sizes[1:] <= MAX_CLUSTER_SIZE)
+    )[0] + 1
+    if valid_ids.size == 0:
+        return []
+
+    rows, cols = _coord_grids(human_mask.shape)
+    valid_sizes = sizes[valid_ids]
+    center_rows = np.bincount(flat, weights=rows)[valid_ids] / valid_sizes
+    center_cols = np.bincount(flat, weights=cols)[valid_ids] / valid_sizes
+
     people_clusters = []
-    for i in range(1, num_features + 1):
-        cluster_size = np.sum(labeled_array == i)
-        if MIN_CLUSTER_SIZE <= cluster_size <= MAX_CLUSTER_SIZE:
-            # Get cluster center and bounds
-            cluster_pixels = np.where(labeled_array == i)
-            center_row = int(np.mean(cluster_pixels[0]))
-            center_col = int(np.mean(cluster_pixels[1]))
-            people_clusters.append({
-                'id': i,
-                'size': cluster_size,
-                'center': (center_row, center_col)
-            })
-    
+    for cluster_id, size, center_row, center_col in zip(
+            valid_ids, valid_sizes, center_rows, center_cols):
+        people_clusters.append({
+            'id': int(cluster_id),
+            'size': int(size),
+            'center': (int(center_row), int(center_col))
+        })
+
     return people_clusters
 
 def estimate_occupancy(thermal_data):
-    """Estimate room occupancy from thermal data."""
+    """Estimate room occupancy from thermal data.
+
+    The stages below (median -> mask -> label -> stats) deliberately stay
+    on NumPy/SciPy rather than a JIT-fused kernel: on a 768-pixel grid
+    the whole pipeline runs in well under a millisecond with pooled
+    buffers, which a numba dependency and its first-call compile cost
+    would not meaningfully improve.
+    """
     try:
         # Convert to 2D array
         temp_array_2d = thermal_data_to_array(thermal_data)
@@ -176,7 +416,7 @@ def estimate_occupancy(thermal_data):
             'people_clusters': people_clusters
         }
     except Exception as e:
-        print(f"Error estimating occupancy: {e}")
+        logger.exception("Error estimating occupancy")
         return {
             'occupancy': 0,
             'room_temperature': None,
@@ -184,120 +424,293 @@ def estimate_occupancy(thermal_data):
             'error': str(e)
         }
 
-def _sanitize_sensor_id_for_filename(sensor_id):
-    """Make sensor_id safe for use in filenames (alphanumeric and underscores only)."""
-    if not sensor_id:
-        return "unknown"
-    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(sensor_id))[:64]
+# Disk writes happen off the request path: ingest handlers enqueue save
+# work and return immediately, and a single daemon thread drains the
+# queue in batches so a slow disk never blocks the ESP32's next POST.
+# When the queue backs up, frames are dropped rather than stalling ingest.
+_write_q = queue.Queue(maxsize=1024)
+_WRITE_BATCH = 64
 
 
-def save_thermal_data(compact_data, expanded_data, sensor_id=None):
-    """Save thermal data to disk."""
-    global _data_counter
-    
+# Daily logs stay open across batches (writer thread only). Each batch
+# is then a single buffered write+flush with no open/close syscalls; the
+# small cap just keeps fds bounded across day rollovers.
+_log_fds = {}
+_LOG_FD_MAX = 8
+
+
+def _append_jsonl_entries(log_file, entries):
+    """Append a batch of entries to a daily log in one write (writer thread only)."""
+    try:
+        f = _log_fds.get(log_file)
+        if f is None:
+            if len(_log_fds) >= _LOG_FD_MAX:
+                for old in _log_fds.values():
+                    old.close()
+                _log_fds.clear()
+            f = _log_fds[log_file] = open(log_file, 'ab')
+        f.write(b''.join(
+            orjson.dumps(e, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n'
+            for e in entries
+        ))
+        f.flush()
+    except Exception:
+        logger.exception("Error appending to %s", log_file.name)
+
+
+class _FrameLog:
+    """Packed per-day frame store (writer thread only).
+
+    Each float32 frame is deflate-compressed (zlib level 1, the fastest
+    stdlib codec) and appended to one frames_YYYYMMDD.bin per day, with a
+    JSONL sidecar index recording (timestamp, sensor_id, w, h, min, max,
+    offset, length) so individual frames can be seeked and inflated
+    without parsing the whole day. Compared to JSON-per-frame this packs
+    768 temps into a few hundred bytes and keeps both files open across
+    appends.
+    """
+
+    def __init__(self):
+        self._day = None
+        self._data_f = None
+        self._index_f = None
+        self._offset = 0
+
+    def _roll(self, day):
+        self.close()
+        self._data_f = open(DATA_DIR / f"frames_{day}.bin", 'ab')
+        self._index_f = open(DATA_DIR / f"frames_{day}.index.jsonl", 'ab')
+        self._offset = self._data_f.tell()
+        self._day = day
+
+    def append(self, entry):
+        day = entry['timestamp'][:10].replace('-', '')
+        if day != self._day:
+            self._roll(day)
+        temps = np.asarray(entry.pop('_frame'), dtype=np.float32)
+        payload = zlib.compress(temps.tobytes(), 1)
+        self._data_f.write(payload)
+        entry['offset'] = self._offset
+        entry['length'] = len(payload)
+        self._offset += len(payload)
+        self._index_f.write(orjson.dumps(entry) + b'\n')
+
+    def flush(self):
+        if self._data_f is not None:
+            self._data_f.flush()
+            self._index_f.flush()
+
+    def close(self):
+        if self._data_f is not None:
+            self._data_f.close()
+            self._index_f.close()
+            self._data_f = self._index_f = None
+
+
+_frame_log = _FrameLog()
+
+
+def _disk_writer():
+    """Drain the save queue forever, batching entries that arrive together.
+
+    Entries destined for the same daily log are grouped into a single
+    write() call, amortizing the open/write/close cost across the batch.
+    Frame entries for the binary store go through _frame_log, which keeps
+    its files open, and are flushed once per batch.
+    """
+    while True:
+        batch = [_write_q.get()]
+        while len(batch) < _WRITE_BATCH:
+            try:
+                batch.append(_write_q.get_nowait())
+            except queue.Empty:
+                break
+
+        grouped = {}
+        frames = []
+        for sink, entry in batch:
+            if isinstance(sink, Path):
+                grouped.setdefault(sink, []).append(entry)
+            else:
+                frames.append(entry)
+        for log_file, entries in grouped.items():
+            _append_jsonl_entries(log_file, entries)
+        if frames:
+            try:
+                for entry in frames:
+                    _frame_log.append(entry)
+                _frame_log.flush()
+            except Exception:
+                logger.exception("Error appending to binary frame log")
+
+        for _ in batch:
+            _write_q.task_done()
+
+
+threading.Thread(target=_disk_writer, daemon=True, name='disk-writer').start()
+
+
+def save_thermal_data(compact_data, sensor_id=None):
+    """Queue one frame's compact data for the background disk writer.
+
+    Only the compact format is persisted: the expanded/colorized form is
+    fully derivable from it, and writing both (pretty-printed, one file
+    per frame) dominated disk bandwidth. Frames append to one JSONL log
+    per day instead of creating a new file every upload.
+    """
     if not SAVE_DATA:
         return
-    
-    sid = sensor_id or compact_data.get("sensor_id") or "unknown"
-    safe_id = _sanitize_sensor_id_for_filename(sid)
-    
-    try:
-        timestamp = datetime.now()
-        timestamp_str = timestamp.strftime('%Y%m%d_%H%M%S_%f')[:-3]  # Include milliseconds
-        
-        # Save compact format (original, smaller file)
-        compact_filename = DATA_DIR / f"thermal_{safe_id}_{timestamp_str}_compact.json"
-        with open(compact_filename, 'w') as f:
-            json.dump({
-                "timestamp": timestamp.isoformat(),
-                "format": "compact",
-                "sensor_id": sid,
-                "data": compact_data
-            }, f, indent=2)
-        
-        # Save expanded format (with color data, for analysis)
-        expanded_filename = DATA_DIR / f"thermal_{safe_id}_{timestamp_str}_expanded.json"
-        with open(expanded_filename, 'w') as f:
-            json.dump({
-                "timestamp": timestamp.isoformat(),
-                "format": "expanded",
-                "sensor_id": sid,
-                "data": expanded_data
-            }, f, indent=2)
-        
-        _data_counter += 1
-        print(f"Saved thermal data: {compact_filename.name} ({expanded_filename.name})")
-        
-    except Exception as e:
-        print(f"Error saving thermal data to disk: {e}")
-
-def convert_numpy_types(obj):
-    """Recursively convert numpy types to native Python types for JSON serialization."""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    elif isinstance(obj, tuple):
-        return tuple(convert_numpy_types(item) for item in obj)
+
+    timestamp = datetime.now()
+    if FRAME_LOG_BINARY and 't' in compact_data:
+        # Packed binary store: temps go to frames_YYYYMMDD.bin, metadata
+        # to the sidecar index
+        item = (_frame_log, {
+            "timestamp": timestamp.isoformat(),
+            "sensor_id": sensor_id or compact_data.get("sensor_id") or "unknown",
+            "w": compact_data.get("w"),
+            "h": compact_data.get("h"),
+            "min": compact_data.get("min"),
+            "max": compact_data.get("max"),
+            "_frame": compact_data['t']
+        })
     else:
-        return obj
+        log_file = DATA_DIR / f"thermal_{timestamp.strftime('%Y%m%d')}.jsonl"
+        item = (log_file, {
+            "timestamp": timestamp.isoformat(),
+            "format": "compact",
+            "sensor_id": sensor_id or compact_data.get("sensor_id") or "unknown",
+            "data": compact_data
+        })
+    try:
+        _write_q.put_nowait(item)
+    except queue.Full:
+        logger.warning("Disk write queue full, dropping thermal frame")
+
+
+# Running per-day occupancy aggregates so /api/occupancy/stats is O(1)
+# instead of rescanning the day's log on every request. Keyed
+# (date, sensor_id), with None aggregating across sensors. Today's keys
+# update on every POST (seeded from the log at startup); other dates are
+# rebuilt from their log once on demand.
+_day_stats = {}
+# date_str -> Event, set once that day's log has been folded in; claimed
+# under _stats_lock so concurrent first requests can't both scan
+_stats_rebuilt = {}
+_stats_lock = threading.Lock()
+
+
+def _record_occupancy_stats(date_str, sensor_id, value):
+    """Fold one occupancy reading into the day's running aggregates."""
+    with _stats_lock:
+        for key in ((date_str, None), (date_str, sensor_id)):
+            stats = _day_stats.get(key)
+            if stats is None:
+                stats = _day_stats[key] = {'n': 0, 'sum': 0, 'min': None,
+                                           'max': None, 'last': None,
+                                           'counter': Counter()}
+            stats['n'] += 1
+            stats['sum'] += value
+            if stats['min'] is None or value < stats['min']:
+                stats['min'] = value
+            if stats['max'] is None or value > stats['max']:
+                stats['max'] = value
+            stats['last'] = value
+            stats['counter'][value] += 1
+
+
+def _rebuild_day_stats(log_file, date_str):
+    """Seed a day's aggregates with a single scan of its log.
+
+    Exactly one thread scans a given day: the date is claimed under
+    _stats_lock (the handlers run on waitress's thread pool, and two
+    unguarded first requests would each fold the log in, doubling every
+    aggregate), and late arrivals wait on the claimant's Event instead
+    of serving half-seeded totals.
+    """
+    with _stats_lock:
+        seeded = _stats_rebuilt.get(date_str)
+        if seeded is None:
+            seeded = _stats_rebuilt[date_str] = threading.Event()
+            claimant = True
+        else:
+            claimant = False
+    if not claimant:
+        seeded.wait()
+        return
+    try:
+        with open(log_file, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = orjson.loads(line)
+                _record_occupancy_stats(date_str, entry.get('sensor_id') or 'unknown',
+                                        entry['occupancy'])
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.exception("Error rebuilding stats from %s", log_file.name)
+    finally:
+        seeded.set()
+
+
+# Pick up entries logged before a restart so today's running totals
+# stay consistent with the file
+if SAVE_DATA:
+    _startup_day = datetime.now().strftime('%Y%m%d')
+    _rebuild_day_stats(DATA_DIR / f"occupancy_{_startup_day}.jsonl", _startup_day)
+
 
 def save_occupancy_data(occupancy_result):
-    """Save occupancy estimation to disk with timestamp."""
+    """Queue an occupancy estimate for the background disk writer."""
     if not SAVE_DATA:
         return
-    
+
+    timestamp = datetime.now()
+    # One log file per day; orjson handles any NumPy scalars in the entry
+    log_file = DATA_DIR / f"occupancy_{timestamp.strftime('%Y%m%d')}.jsonl"
+    occupancy_entry = {
+        "timestamp": timestamp.isoformat(),
+        "sensor_id": occupancy_result.get("sensor_id") or "unknown",
+        "occupancy": occupancy_result['occupancy'],
+        "room_temperature": occupancy_result.get('room_temperature'),
+        "people_clusters": occupancy_result.get('people_clusters', [])
+    }
     try:
-        timestamp = datetime.now()
-        
-        # Create occupancy log file (one per day)
-        date_str = timestamp.strftime('%Y%m%d')
-        occupancy_log_file = DATA_DIR / f"occupancy_{date_str}.jsonl"
-        
-        # Convert numpy types to native Python types for JSON serialization
-        sensor_id = occupancy_result.get("sensor_id") or "unknown"
-        occupancy_entry = {
-            "timestamp": timestamp.isoformat(),
-            "sensor_id": sensor_id,
-            "occupancy": int(occupancy_result['occupancy']),
-            "room_temperature": float(occupancy_result.get('room_temperature')) if occupancy_result.get('room_temperature') is not None else None,
-            "people_clusters": convert_numpy_types(occupancy_result.get('people_clusters', []))
-        }
-        
-        with open(occupancy_log_file, 'a') as f:
-            f.write(json.dumps(occupancy_entry) + '\n')
-        
-    except Exception as e:
-        print(f"Error saving occupancy data to disk: {e}")
-        import traceback
-        traceback.print_exc()
+        _write_q.put_nowait((log_file, occupancy_entry))
+    except queue.Full:
+        logger.warning("Disk write queue full, dropping occupancy entry")
+        return
+    # Aggregates track what actually reaches the log, so only update
+    # after a successful enqueue
+    _record_occupancy_stats(timestamp.strftime('%Y%m%d'),
+                            occupancy_entry['sensor_id'],
+                            occupancy_entry['occupancy'])
+
+def _json_response(data, status=200):
+    """Serialize a response with orjson instead of Flask's jsonify.
+
+    orjson encodes in native code and handles NumPy scalars/arrays directly
+    (OPT_SERIALIZE_NUMPY), so responses skip the stdlib json dict walk.
+    """
+    return Response(
+        orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS),
+        status=status,
+        mimetype='application/json'
+    )
+
+def _ingest_frame(data):
+    """Process one thermal frame: expand, estimate occupancy, cache, save.
+
+    Shared by the JSON and binary ingest endpoints; `data` is a
+    compact-format dict (w/h/min/max/t, optionally sensor_id).
+    """
+    global latest_thermal_data, last_update_time, latest_occupancy, _response_state
 
-@app.route('/api/thermal', methods=['POST'])
-def receive_thermal_data():
-    """Receive thermal data from ESP32."""
-    global latest_thermal_data, last_update_time, latest_occupancy
-    
     try:
-        # Handle potential client disconnection gracefully
-        try:
-            data = request.get_json()
-        except Exception as e:
-            # Client disconnected or invalid request
-            print(f"Error reading request data: {e}")
-            return jsonify({"error": "Invalid request"}), 400
-        
-        if not data:
-            print("ERROR: No JSON data received")
-            return jsonify({"error": "No data received"}), 400
-        
-        print(f"Received data: keys={list(data.keys())}, has 't'={('t' in data)}")
-        
+        if 'q' in data and 't' not in data:
+            data = dequantize_thermal_data(data)
         # Store original compact data for saving
         compact_data = data.copy()
         sensor_id = data.get("sensor_id") or "unknown"
@@ -308,10 +721,10 @@ def receive_thermal_data():
                 expanded_data = expand_thermal_data(data)
                 expanded_data["sensor_id"] = sensor_id
                 latest_thermal_data = expanded_data
-                print(f"Expanded to {len(expanded_data.get('pixels', []))} pixels")
+                logger.debug("Expanded %dx%d frame", expanded_data['width'], expanded_data['height'])
             except Exception as e:
-                print(f"Error expanding data: {e}")
-                return jsonify({"error": f"Data expansion failed: {e}"}), 500
+                logger.error("Error expanding data: %s", e)
+                return _json_response({"error": f"Data expansion failed: {e}"}, 500)
         else:  # Full format (backwards compatible)
             latest_thermal_data = data if data.get("sensor_id") else {**data, "sensor_id": sensor_id}
             expanded_data = latest_thermal_data
@@ -320,283 +733,186 @@ def receive_thermal_data():
         occupancy_result = estimate_occupancy(data)
         occupancy_result["sensor_id"] = sensor_id
         latest_occupancy = occupancy_result
-        print(f"Occupancy estimate: {occupancy_result['occupancy']} person(s) [sensor_id={sensor_id}]")
+        logger.debug("Occupancy estimate: %s person(s) [sensor_id=%s]",
+                     occupancy_result['occupancy'], sensor_id)
         
         last_update_time = datetime.now().isoformat()
-        
+
+        # Serialize the GET response once here; the data only changes on
+        # POST, so every poll in between can reuse the same bytes
+        body = {
+            **expanded_data,
+            'last_update': last_update_time,
+            'occupancy': occupancy_result['occupancy'],
+            'room_temperature': occupancy_result.get('room_temperature')
+        }
+        body_bytes = orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY)
+        # Level 1 is fast and plenty for JSON; compressing once here means
+        # pollers never pay for it
+        body_gz = gzip.compress(body_bytes, compresslevel=1)
+        with _state_lock:
+            _response_state = (body_bytes, body_gz, last_update_time)
+
+
         # Save to disk
-        save_thermal_data(compact_data, expanded_data, sensor_id)
+        save_thermal_data(compact_data, sensor_id)
         save_occupancy_data(occupancy_result)
         
-        pixel_count = len(latest_thermal_data.get('pixels', []))
-        print(f"Success: stored {pixel_count} pixels")
-        return jsonify({"status": "success", "received": pixel_count, "occupancy": occupancy_result['occupancy']}), 200
+        pixel_count = len(data.get('t', data.get('pixels', [])))
+        logger.debug("Success: stored %d pixels", pixel_count)
+        return _json_response({"status": "success", "received": pixel_count, "occupancy": occupancy_result['occupancy']}, 200)
     except Exception as e:
-        print(f"ERROR in receive_thermal_data: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Error ingesting thermal frame")
+        return _json_response({"error": str(e)}, 500)
+
+@app.route('/api/thermal', methods=['POST'])
+def receive_thermal_data():
+    """Receive thermal data from ESP32 as compact JSON."""
+    # Parse with orjson directly rather than request.get_json(): the 768
+    # temperature floats dominate the payload and orjson decodes them in
+    # native code. cache=False skips stashing the raw body on the request.
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        data = None
+    if not data or not isinstance(data, dict):
+        logger.warning("No or invalid JSON data received")
+        return _json_response({"error": "No data received"}, 400)
+
+    logger.debug("Received data: keys=%s, has 't'=%s", list(data.keys()), 't' in data)
+    return _ingest_frame(data)
+
+# Binary frame layout (little-endian): [w:u16][h:u16][min:f32][max:f32]
+# header followed by w*h int16 temperatures in centi-degC
+_BIN_HEADER = struct.Struct('<HHff')
+
+@app.route('/api/thermal_bin', methods=['POST'])
+def receive_thermal_data_bin():
+    """Receive thermal data from ESP32 as a packed binary frame.
+
+    Skips JSON parsing entirely: the temperature block is a single
+    np.frombuffer view instead of per-element float conversion, and the
+    payload is ~6x smaller on the wire. The JSON endpoint remains for
+    backward compatibility.
+    """
+    buf = request.get_data(cache=False)
+    if len(buf) < _BIN_HEADER.size:
+        return _json_response({"error": "Truncated header"}, 400)
+    w, h, min_temp, max_temp = _BIN_HEADER.unpack_from(buf, 0)
+    expected = _BIN_HEADER.size + w * h * 2
+    if len(buf) != expected:
+        logger.warning("Binary frame size mismatch: got %d, expected %d", len(buf), expected)
+        return _json_response({"error": "Frame size mismatch"}, 400)
+    temps = np.frombuffer(buf, dtype='<i2', offset=_BIN_HEADER.size, count=w * h)
+    data = {
+        "sensor_id": request.args.get("sensor_id") or "unknown",
+        "w": w,
+        "h": h,
+        "min": round(min_temp, 2),
+        "max": round(max_temp, 2),
+        "t": temps.astype(np.float32) * np.float32(0.01)
+    }
+    return _ingest_frame(data)
 
 @app.route('/api/thermal', methods=['GET'])
 def get_thermal_data():
-    """Get the latest thermal data."""
-    if latest_thermal_data is None:
-        return jsonify({"error": "No data available"}), 404
-    
-    response = latest_thermal_data.copy()
-    response['last_update'] = last_update_time
-    if latest_occupancy is not None:
-        response['occupancy'] = latest_occupancy['occupancy']
-        response['room_temperature'] = latest_occupancy.get('room_temperature')
-    return jsonify(response), 200
+    """Get the latest thermal data (pre-serialized at POST time)."""
+    snap = _response_state
+    if snap is None:
+        return _json_response({"error": "No data available"}, 404)
+    body, body_gz, update_time = snap
+    # The body only changes when the ESP32 posts, so the update time makes
+    # a perfect ETag: unchanged polls get an empty 304 instead of a body
+    etag = f'"{update_time}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        return Response(body_gz, mimetype='application/json',
+                        headers={'Content-Encoding': 'gzip', 'ETag': etag})
+    return Response(body, mimetype='application/json', headers={'ETag': etag})
+
+# Page bytes loaded once at import; send_static_file re-stats and
+# re-opens the file per request, which the 1 Hz polling page never needs
+_INDEX_HTML = (Path(__file__).parent / 'static' / 'index.html').read_bytes()
+_INDEX_HEADERS = {
+    'Content-Length': str(len(_INDEX_HTML)),
+    'Cache-Control': 'public, max-age=3600'
+}
+
 
 @app.route('/')
 def index():
     """Serve the web interface."""
-    return """<!DOCTYPE html>
-<html>
-<head>
-    <title>ESP32 Thermal Camera</title>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            background: #1a1a1a;
-            color: #fff;
-            margin: 0;
-            padding: 20px;
-            text-align: center;
-        }
-        h1 {
-            margin-bottom: 10px;
-        }
-        .info {
-            margin: 10px 0;
-            font-size: 14px;
-        }
-        #thermalCanvas {
-            border: 2px solid #333;
-            background: #000;
-            margin: 20px auto;
-            display: block;
-            image-rendering: pixelated;
-            image-rendering: crisp-edges;
-        }
-        .status {
-            margin: 10px 0;
-            font-size: 12px;
-            color: #aaa;
-        }
-    </style>
-</head>
-<body>
-    <h1>ESP32 Thermal Camera</h1>
-    <div class="info">
-        <div>Min: <span id="minTemp">--</span>°C | Max: <span id="maxTemp">--</span>°C</div>
-        <div style="font-size: 18px; margin: 15px 0; font-weight: bold;">
-            Occupancy: <span id="occupancy">--</span> person(s)
-        </div>
-        <div style="font-size: 14px; color: #aaa; margin-bottom: 10px;">
-            Room Temp: <span id="roomTemp">--</span>°C
-        </div>
-        <div style="font-size: 12px; color: #888; margin-bottom: 5px;">
-            Sensor: <span id="sensorId">--</span>
-        </div>
-        <div class="status" id="status">Waiting for data...</div>
-    </div>
-    <canvas id="thermalCanvas" width="320" height="240"></canvas>
-    
-    <div style="margin: 30px auto; max-width: 800px;">
-        <h2 style="font-size: 18px; margin-bottom: 10px;">Occupancy Over Time (Today)</h2>
-        <canvas id="occupancyChart" style="background: #2a2a2a; border: 1px solid #444;"></canvas>
-    </div>
-    
-    <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"></script>
-    <script>
-        const thermalCanvas = document.getElementById('thermalCanvas');
-        const thermalCtx = thermalCanvas.getContext('2d');
-        
-        function refreshImage() {
-            fetch('/api/thermal')
-                .then(response => {
-                    if (!response.ok) {
-                        throw new Error(`HTTP error! status: ${response.status}`);
-                    }
-                    return response.json();
-                })
-                .then(data => {
-                    console.log('Received data:', data); // Debug log
-                    if (data.error) {
-                        document.getElementById('status').textContent = 'No data available: ' + data.error;
-                        document.getElementById('occupancy').textContent = '--';
-                        document.getElementById('roomTemp').textContent = '--';
-                        return;
-                    }
-                    
-                    // Check if we have pixel data
-                    if (!data.pixels || !Array.isArray(data.pixels) || data.pixels.length === 0) {
-                        console.error('No pixel data in response:', data);
-                        document.getElementById('status').textContent = 'No pixel data available';
-                        return;
-                    }
-                    
-                    drawThermalImage(data);
-                    document.getElementById('minTemp').textContent = data.min_temp || '--';
-                    document.getElementById('maxTemp').textContent = data.max_temp || '--';
-                    
-                    // Update occupancy
-                    if (data.occupancy !== undefined) {
-                        document.getElementById('occupancy').textContent = data.occupancy;
-                    } else {
-                        document.getElementById('occupancy').textContent = '--';
-                    }
-                    
-                    // Update room temperature
-                    if (data.room_temperature !== undefined && data.room_temperature !== null) {
-                        document.getElementById('roomTemp').textContent = data.room_temperature.toFixed(1);
-                    } else {
-                        document.getElementById('roomTemp').textContent = '--';
-                    }
-                    
-                    // Update sensor ID
-                    document.getElementById('sensorId').textContent = data.sensor_id || '--';
-                    
-                    if (data.last_update) {
-                        const updateTime = new Date(data.last_update).toLocaleTimeString();
-                        document.getElementById('status').textContent = 'Last update: ' + updateTime;
-                    } else {
-                        document.getElementById('status').textContent = 'Data received';
-                    }
-                })
-                .catch(error => {
-                    console.error('Error fetching thermal data:', error);
-                    document.getElementById('status').textContent = 'Error: ' + error.message;
-                    document.getElementById('occupancy').textContent = '--';
-                    document.getElementById('roomTemp').textContent = '--';
-                });
-        }
-        
-        function drawThermalImage(data) {
-            const pixelSize = Math.min(
-                Math.floor(thermalCanvas.width / data.width),
-                Math.floor(thermalCanvas.height / data.height)
-            );
-            
-            const offsetX = (thermalCanvas.width - data.width * pixelSize) / 2;
-            const offsetY = (thermalCanvas.height - data.height * pixelSize) / 2;
-            
-            thermalCtx.clearRect(0, 0, thermalCanvas.width, thermalCanvas.height);
-            
-            data.pixels.forEach(pixel => {
-                thermalCtx.fillStyle = `rgb(${pixel.r}, ${pixel.g}, ${pixel.b})`;
-                thermalCtx.fillRect(
-                    offsetX + pixel.col * pixelSize,
-                    offsetY + pixel.row * pixelSize,
-                    pixelSize,
-                    pixelSize
-                );
-            });
-        }
-        
-        // Initialize occupancy chart
-        const chartCtx = document.getElementById('occupancyChart').getContext('2d');
-        const occupancyChart = new Chart(chartCtx, {
-            type: 'line',
-            data: {
-                labels: [],
-                datasets: [{
-                    label: 'Occupancy',
-                    data: [],
-                    borderColor: 'rgb(75, 192, 192)',
-                    backgroundColor: 'rgba(75, 192, 192, 0.2)',
-                    tension: 0.1,
-                    fill: true
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: true,
-                plugins: {
-                    legend: {
-                        labels: {
-                            color: '#fff'
-                        }
-                    }
-                },
-                scales: {
-                    x: {
-                        ticks: {
-                            color: '#aaa',
-                            maxTicksLimit: 12
-                        },
-                        grid: {
-                            color: '#333'
-                        }
-                    },
-                    y: {
-                        beginAtZero: true,
-                        ticks: {
-                            color: '#aaa',
-                            stepSize: 1
-                        },
-                        grid: {
-                            color: '#333'
-                        }
-                    }
-                }
-            }
-        });
-        
-        // Function to update occupancy chart
-        function updateOccupancyChart() {
-            fetch('/api/occupancy/history')
-                .then(response => response.json())
-                .then(data => {
-                    if (data.error || !data.data || data.data.length === 0) {
-                        return;
-                    }
-                    
-                    // Process data for chart
-                    const labels = [];
-                    const occupancyValues = [];
-                    
-                    data.data.forEach(entry => {
-                        const date = new Date(entry.timestamp);
-                        const timeStr = date.toLocaleTimeString('en-US', { 
-                            hour: '2-digit', 
-                            minute: '2-digit',
-                            hour12: false 
-                        });
-                        labels.push(timeStr);
-                        occupancyValues.push(entry.occupancy);
-                    });
-                    
-                    // Update chart
-                    occupancyChart.data.labels = labels;
-                    occupancyChart.data.datasets[0].data = occupancyValues;
-                    occupancyChart.update('none'); // 'none' mode for smooth updates
-                })
-                .catch(error => {
-                    console.error('Error fetching occupancy history:', error);
-                });
-        }
-        
-        // Refresh thermal image every 1 second
-        refreshImage();
-        setInterval(refreshImage, 1000);
-        
-        // Update occupancy chart every 5 seconds
-        updateOccupancyChart();
-        setInterval(updateOccupancyChart, 5000);
-    </script>
-</body>
-</html>"""
+    return Response(_INDEX_HTML, mimetype='text/html', headers=_INDEX_HEADERS)
 
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
     """Test endpoint to verify server is running."""
-    return jsonify({"status": "server is running", "time": datetime.now().isoformat()}), 200
+    return _json_response({"status": "server is running", "time": datetime.now().isoformat()}, 200)
+
+# History responses cached per (date, sensor_id) and invalidated by the
+# log file's (mtime_ns, size). When the log only grew - the steady state
+# for today's file under the 5s browser poll - just the appended tail is
+# read and spliced onto the cached bytes.
+_history_cache = {}
+_HISTORY_CACHE_MAX = 32
+_history_lock = threading.Lock()
+
+
+def _history_lines(log_file, date_str, filter_sensor_id):
+    """Return (spliced_lines, count, etag) for a daily log, incrementally."""
+    st = log_file.stat()
+    key = (date_str, filter_sensor_id)
+    with _history_lock:
+        cached = _history_cache.get(key)
+        if cached is not None and \
+                (cached['mtime_ns'], cached['size']) == (st.st_mtime_ns, st.st_size):
+            return bytes(cached['joined']), cached['count'], cached['etag']
+
+        if cached is not None and st.st_size > cached['size']:
+            # Log grew in place: pick up from the already-consumed offset.
+            # Splice onto a copy of the cached buffer so an exception
+            # mid-read can't leave the cached entry half-updated
+            offset = cached['size']
+            joined = bytearray(cached['joined'])
+            count = cached['count']
+        else:
+            offset, joined, count = 0, bytearray(), 0
+
+        # The disk writer appends concurrently, so read exactly the bytes
+        # the stat() above promised and consume only through the last
+        # newline in that window: anything past the stat'd size would be
+        # re-read on the next poll (duplicating entries in the cache), and
+        # a torn final line mid-append would splice a JSON fragment into
+        # the cached body. The remainder is picked up by a later poll.
+        with open(log_file, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(st.st_size - offset)
+        end = chunk.rfind(b'\n')
+        consumed = offset if end < 0 else offset + end + 1
+        if end >= 0:
+            # Entries are only decoded when a sensor_id filter actually
+            # needs to inspect them; otherwise raw lines splice straight
+            # through
+            for line in chunk[:end].split(b'\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                if filter_sensor_id is not None and \
+                        orjson.loads(line).get("sensor_id") != filter_sensor_id:
+                    continue
+                if joined:
+                    joined += b','
+                joined += line
+                count += 1
+
+        etag = f'"{st.st_mtime_ns}-{consumed}"'
+        if len(_history_cache) >= _HISTORY_CACHE_MAX:
+            _history_cache.clear()
+        _history_cache[key] = {'mtime_ns': st.st_mtime_ns, 'size': consumed,
+                               'joined': joined, 'count': count, 'etag': etag}
+        return bytes(joined), count, etag
+
 
 @app.route('/api/occupancy/history', methods=['GET'])
 def get_occupancy_history():
@@ -606,28 +922,22 @@ def get_occupancy_history():
         date_str = request.args.get('date', datetime.now().strftime('%Y%m%d'))
         filter_sensor_id = request.args.get('sensor_id')
         occupancy_log_file = DATA_DIR / f"occupancy_{date_str}.jsonl"
-        
+
         if not occupancy_log_file.exists():
-            return jsonify({"error": f"No occupancy data found for date {date_str}"}), 404
-        
-        # Read all lines from the log file
-        occupancy_data = []
-        with open(occupancy_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    entry = json.loads(line)
-                    if filter_sensor_id is None or entry.get("sensor_id") == filter_sensor_id:
-                        occupancy_data.append(entry)
-        
-        return jsonify({
-            "date": date_str,
-            "sensor_id": filter_sensor_id,
-            "count": len(occupancy_data),
-            "data": occupancy_data
-        }), 200
-        
+            return _json_response({"error": f"No occupancy data found for date {date_str}"}, 404)
+
+        joined, count, etag = _history_lines(occupancy_log_file, date_str, filter_sensor_id)
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+
+        body = (b'{"date":' + orjson.dumps(date_str)
+                + b',"sensor_id":' + orjson.dumps(filter_sensor_id)
+                + b',"count":' + str(count).encode()
+                + b',"data":[' + joined + b']}')
+        return Response(body, mimetype='application/json', headers={'ETag': etag})
+
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _json_response({"error": str(e)}, 500)
 
 @app.route('/api/occupancy/stats', methods=['GET'])
 def get_occupancy_stats():
@@ -638,40 +948,37 @@ def get_occupancy_stats():
         filter_sensor_id = request.args.get('sensor_id')
         occupancy_log_file = DATA_DIR / f"occupancy_{date_str}.jsonl"
         
-        if not occupancy_log_file.exists():
-            return jsonify({"error": f"No occupancy data found for date {date_str}"}), 404
-        
-        # Read all lines and calculate statistics
-        occupancy_values = []
-        with open(occupancy_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    entry = json.loads(line)
-                    if filter_sensor_id is None or entry.get("sensor_id") == filter_sensor_id:
-                        occupancy_values.append(entry['occupancy'])
-        
-        if not occupancy_values:
-            return jsonify({"error": "No occupancy data available"}), 404
-        
-        # Calculate statistics
-        stats = {
-            "date": date_str,
-            "sensor_id": filter_sensor_id,
-            "total_readings": len(occupancy_values),
-            "min_occupancy": min(occupancy_values),
-            "max_occupancy": max(occupancy_values),
-            "avg_occupancy": round(sum(occupancy_values) / len(occupancy_values), 2),
-            "current_occupancy": occupancy_values[-1] if occupancy_values else 0
-        }
-        
-        # Count occurrences of each occupancy level
-        occupancy_counts = Counter(occupancy_values)
-        stats["occupancy_distribution"] = dict(occupancy_counts)
-        
-        return jsonify(stats), 200
+        # Serve from the running aggregates; past dates get a one-time
+        # rebuild scan of their log, after which they are O(1) too
+        key = (date_str, filter_sensor_id)
+        with _stats_lock:
+            stats = _day_stats.get(key)
+        if stats is None:
+            if not occupancy_log_file.exists():
+                return _json_response({"error": f"No occupancy data found for date {date_str}"}, 404)
+            _rebuild_day_stats(occupancy_log_file, date_str)
+            with _stats_lock:
+                stats = _day_stats.get(key)
+
+        if stats is None or stats['n'] == 0:
+            return _json_response({"error": "No occupancy data available"}, 404)
+
+        with _stats_lock:
+            result = {
+                "date": date_str,
+                "sensor_id": filter_sensor_id,
+                "total_readings": stats['n'],
+                "min_occupancy": stats['min'],
+                "max_occupancy": stats['max'],
+                "avg_occupancy": round(stats['sum'] / stats['n'], 2),
+                "current_occupancy": stats['last'],
+                "occupancy_distribution": dict(stats['counter'])
+            }
+
+        return _json_response(result, 200)
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _json_response({"error": str(e)}, 500)
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -687,6 +994,14 @@ if __name__ == '__main__':
         print("Data storage: DISABLED")
     print("=" * 60)
     print("\nWaiting for ESP32 to send thermal data...\n")
-    
+
     # Run on all interfaces so ESP32 can connect. Use PORT from env (e.g. Azure).
-    app.run(host='0.0.0.0', port=port, debug=True)
+    if os.environ.get('FLASK_DEBUG'):
+        # Dev server with reloader/debugger - single-threaded, opt-in only
+        app.run(host='0.0.0.0', port=port, debug=True)
+    else:
+        # Waitress thread pool keeps browser polls from queuing behind
+        # ESP32 POSTs (the dev server handles one request at a time)
+        from waitress import serve
+        print(f"Serving with waitress ({os.environ.get('WEB_THREADS', 4)} threads)")
+        serve(app, host='0.0.0.0', port=port, threads=int(os.environ.get('WEB_THREADS', 4)))
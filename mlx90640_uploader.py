@@ -5,66 +5,66 @@ Upload interval is configurable via UPLOAD_INTERVAL variable
 """
 
 import time
-import json
 import os
 import gc
+import binascii
 gc.collect()
 
-import board
-import busio
 import wifi
 import socketpool
-import adafruit_mlx90640
-from adafruit_mlx90640 import RefreshRate
-
-gc.collect()
-
-# Thermal image dimensions
-MLX_SHAPE = (24, 32)  # 24 rows, 32 columns
-FRAME_SIZE = MLX_SHAPE[0] * MLX_SHAPE[1]  # 768 pixels
+from mlx_common import MLX_SHAPE, FRAME_SIZE, init_i2c, init_mlx, minmax
 
 # API configuration - modify this to match your laptop's IP address
 # Get your laptop's IP with: ip addr show (Linux) or ipconfig (Windows)
 API_URL = "http://occupancy-api-b8hcb8hyh7f7aph3.canadacentral-01.azurewebsites.net/api/thermal" # http://10.0.0.111:5000/api/thermal"
 
+
+def _parse_url(url):
+    """Split an http:// URL into (host, port, path)."""
+    if url.startswith("http://"):
+        url = url[7:]
+    parts = url.split('/')
+    host_port = parts[0].split(':')
+    host = host_port[0]
+    port = int(host_port[1]) if len(host_port) > 1 else 80
+    path = '/' + '/'.join(parts[1:]) if len(parts) > 1 else '/'
+    return host, port, path
+
+
+# Parsed once here instead of on every POST
+_API_HOST, _API_PORT, _API_PATH = _parse_url(API_URL)
+
+# Everything in the request header except Content-Length is static
+_HDR_PREFIX = ("POST " + _API_PATH + " HTTP/1.1\r\n"
+               + "Host: " + _API_HOST + ":" + str(_API_PORT) + "\r\n"
+               + "Content-Type: application/json\r\n"
+               + "Connection: keep-alive\r\n").encode('utf-8')
+
 # Unique sensor ID - set in settings.toml so each device is identifiable (e.g. SENSOR_ID = "living-room")
 SENSOR_ID = os.getenv("SENSOR_ID", "default")
 
 # Upload rate - how often to send thermal data to the API (in seconds)
 UPLOAD_INTERVAL = 3.0  # Adjust this value to change upload frequency
 
-# Initialize I2C bus
-gc.collect()
-i2c = None
-try:
-    i2c = busio.I2C(board.SCL, board.SDA, frequency=800000)
-    gc.collect()
-except ValueError as e:
-    if "in use" in str(e).lower() and hasattr(board, 'I2C'):
-        i2c = board.I2C()
-        gc.collect()
-    else:
-        raise
-except Exception as e:
-    raise
-
-# Initialize MLX90640 sensor
-gc.collect()
+# I2C and sensor bring-up (1 MHz bus, 8 Hz refresh) is shared with the
+# test script via mlx_common
+i2c = init_i2c()
 mlx = None
 try:
-    mlx = adafruit_mlx90640.MLX90640(i2c)
-    mlx.refresh_rate = RefreshRate.REFRESH_4_HZ
-    gc.collect()
+    mlx = init_mlx(i2c)
 except Exception:
     mlx = None
 
-# Frame buffer for thermal data
-gc.collect()
-frame = [0.0] * FRAME_SIZE
-gc.collect()
+# Frame buffer for thermal data - allocated once, mlx.getFrame fills it
+# in place. array('f') stores machine floats inline, a fraction of the
+# memory of a list of boxed floats and cheaper for the GC to scan.
+try:
+    from array import array
+    frame = array('f', (0.0 for _ in range(FRAME_SIZE)))
+except ImportError:
+    frame = [0.0] * FRAME_SIZE
 
 # WiFi configuration
-gc.collect()
 ssid = os.getenv("WIFI_SSID")
 password = os.getenv("WIFI_PASSWORD")
 
@@ -76,105 +76,239 @@ ip_addr = wifi.radio.ipv4_address
 gc.collect()
 
 pool = socketpool.SocketPool(wifi.radio)
-gc.collect()
 
 # Color mapping moved to server to save ESP32 memory
 
-def generate_thermal_json(frame_data):
-    """Generate minimal JSON with just raw temperature data - very memory efficient."""
-    # Calculate min/max for the server to use
-    min_temp = min(frame_data)
-    max_temp = max(frame_data)
-    
-    # Build JSON string directly without creating intermediate lists
-    # This is more memory efficient. Include sensor_id for multi-sensor support.
-    json_str = '{"sensor_id":"' + SENSOR_ID.replace('\\', '\\\\').replace('"', '\\"') + '"'
-    json_str += ',"w":' + str(MLX_SHAPE[1])
-    json_str += ',"h":' + str(MLX_SHAPE[0])
-    json_str += ',"min":' + str(round(min_temp, 1))
-    json_str += ',"max":' + str(round(max_temp, 1))
-    json_str += ',"t":[' + str(round(frame_data[0], 1))
-    
-    # Add remaining temperatures one at a time
-    for i in range(1, len(frame_data)):
-        json_str += ',' + str(round(frame_data[i], 1))
-    
-    json_str += ']}'
-    return json_str
-
-def upload_thermal_data(json_data):
-    """Upload thermal data to API server via HTTP POST."""
+# Preallocated payload buffer: the JSON is built in place and sent from
+# here, so each upload creates no per-frame string garbage (the old
+# string concatenation allocated ~768 intermediates per frame). The
+# region before _BODY_OFF is reserved for the HTTP header so header and
+# body go out in a single contiguous send.
+_JSON_BUF = bytearray(8192)
+_JSON_MV = memoryview(_JSON_BUF)
+_BODY_OFF = len(_HDR_PREFIX) + 32  # room for the Content-Length line
+
+# Static payload prefix never changes after boot
+_JSON_PREFIX = ('{"sensor_id":"'
+                + SENSOR_ID.replace('\\', '\\\\').replace('"', '\\"')
+                + '","w":' + str(MLX_SHAPE[1])
+                + ',"h":' + str(MLX_SHAPE[0])).encode('utf-8')
+
+# Reused quantization buffer - one byte per pixel, allocated once
+_Q_BUF = bytearray(FRAME_SIZE)
+
+
+def _write(mv, off, s):
+    """Write string s into the buffer at off; returns the new offset."""
+    b = s.encode('utf-8')
+    mv[off:off + len(b)] = b
+    return off + len(b)
+
+
+_DIGITS = b"0123456789"
+
+
+def _emit_tenths(mv, off, tenths):
+    """Write tenths-of-a-degree fixed point as ASCII (e.g. -123 -> "-12.3").
+
+    Emitting digits straight into the buffer replaces the round() float
+    and str() string that were allocated per temperature.
+    """
+    if tenths < 0:
+        mv[off] = 0x2D  # '-'
+        off += 1
+        tenths = -tenths
+    whole = tenths // 10
+    if whole >= 100:
+        mv[off] = _DIGITS[whole // 100]
+        off += 1
+    if whole >= 10:
+        mv[off] = _DIGITS[(whole // 10) % 10]
+        off += 1
+    mv[off] = _DIGITS[whole % 10]
+    mv[off + 1] = 0x2E  # '.'
+    mv[off + 2] = _DIGITS[tenths % 10]
+    return off + 3
+
+
+def generate_thermal_json(frame_data, min_temp, max_temp):
+    """Build the compact JSON body into _JSON_BUF past the header
+    region; returns the body length.
+
+    Temperatures go out as a base64 string of uint8 values quantized
+    over [min, max] ("q"); the server reconstructs
+    t = min + q * (max - min) / 255. The sensor is only good to about
+    0.5 degC and display color maps use 256 levels, so 8 bits loses
+    nothing visible while shrinking the body from ~4.5 KB to ~1.1 KB.
+    min/max stay in the payload as the quantization anchors - the
+    single source of truth the server already trusts.
+    """
+    # Bind the hot names locally: each global lookup is a dict probe on
+    # CircuitPython, and the loop below does several per temperature
+    emit = _emit_tenths
+    _int = int
+
+    mv = _JSON_MV
+    n = _BODY_OFF + len(_JSON_PREFIX)
+    mv[_BODY_OFF:n] = _JSON_PREFIX
+    off = _write(mv, n, ',"min":')
+    off = emit(mv, off, _int(min_temp * 10.0 + 0.5) if min_temp >= 0
+               else -_int(0.5 - min_temp * 10.0))
+    off = _write(mv, off, ',"max":')
+    off = emit(mv, off, _int(max_temp * 10.0 + 0.5) if max_temp >= 0
+               else -_int(0.5 - max_temp * 10.0))
+    off = _write(mv, off, ',"q":"')
+
+    # Floor the span so a perfectly flat frame (or a sensor glitch
+    # reporting max < min) can't divide by zero or index q out of range
+    span = max_temp - min_temp
+    scale = 255.0 / (span if span > 0.01 else 0.01)
+    q = _Q_BUF
+    i = 0
+    for v in frame_data:
+        q[i] = _int((v - min_temp) * scale)
+        i += 1
+    b64 = binascii.b2a_base64(q)
+    # b2a_base64 appends a newline; drop it
+    end = len(b64) - 1
+    mv[off:off + end] = b64[:end]
+    off += end
+
+    off = _write(mv, off, '"}')
+    return off - _BODY_OFF
+
+# Reused response buffer - big enough for the server's whole success
+# response so the persistent connection is left drained for the next
+# request
+_RESP = bytearray(256)
+_RESP_MV = memoryview(_RESP)
+
+
+def _read_response(socket):
+    """Read one complete HTTP response into _RESP.
+
+    Follows Content-Length so exactly one response is consumed and the
+    persistent connection stays in sync (status line and body can land
+    in separate TCP segments). Returns total bytes read, 0 if the peer
+    closed, or -1 if the response overflowed the buffer.
+    """
+    mv = _RESP_MV
+    buf = _RESP
+    size = len(buf)
+    total = 0
+    body_start = -1
+    body_len = 0
+    while True:
+        if total >= size:
+            return -1
+        nread = socket.recv_into(mv[total:], size - total)
+        if not nread:
+            return total
+        total += nread
+        if body_start < 0:
+            end = buf.find(b'\r\n\r\n', 0, total)
+            if end < 0:
+                continue
+            body_start = end + 4
+            # Find Content-Length case-insensitively on the tail of the
+            # header name; absent means no body to wait for
+            idx = buf.find(b'ontent-Length:', 0, end)
+            if idx < 0:
+                idx = buf.find(b'ontent-length:', 0, end)
+            if idx >= 0:
+                j = idx + 14
+                while buf[j] == 0x20:
+                    j += 1
+                while 0x30 <= buf[j] <= 0x39:
+                    body_len = body_len * 10 + (buf[j] - 0x30)
+                    j += 1
+        if body_start >= 0 and total >= body_start + body_len:
+            return total
+
+# Persistent HTTP connection: TCP setup/teardown per upload costs
+# several round-trips and a socket allocation every cycle, so the
+# connection stays open across uploads and only reopens after an error
+_sock = None
+
+
+def _ensure_socket(host, port):
+    """Return the persistent socket, connecting a new one if needed."""
+    global _sock
+    if _sock is not None:
+        return _sock
     try:
-        # Parse URL
-        if API_URL.startswith("http://"):
-            url_part = API_URL[7:]
-        else:
-            url_part = API_URL
-        
-        parts = url_part.split('/')
-        host_port = parts[0].split(':')
-        host = host_port[0]
-        port = int(host_port[1]) if len(host_port) > 1 else 80
-        path = '/' + '/'.join(parts[1:]) if len(parts) > 1 else '/'
-        
-        # Create socket connection
+        s = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
+    except (AttributeError, TypeError):
+        s = pool.socket()
+    s.settimeout(10.0)
+    s.connect((host, port))
+    # Disable Nagle where the stack allows it so the single-send request
+    # is never held back waiting for more data
+    try:
+        s.setsockopt(pool.SOL_TCP, pool.TCP_NODELAY, 1)
+    except (AttributeError, OSError):
+        pass
+    # Ask for a send buffer that fits the whole ~4.5 KB request so the
+    # single send() rarely returns a partial write
+    try:
+        s.setsockopt(pool.SOL_SOCKET, pool.SO_SNDBUF, 8192)
+    except (AttributeError, OSError):
+        pass
+    _sock = s
+    return s
+
+
+def _drop_socket():
+    """Close and forget the persistent socket so the next upload reconnects."""
+    global _sock
+    if _sock is not None:
         try:
-            socket = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
-        except (AttributeError, TypeError):
-            socket = pool.socket()
-        
+            _sock.close()
+        except:
+            pass
+        _sock = None
+
+
+def upload_thermal_data(json_len):
+    """Upload thermal data from _JSON_BUF to API server via HTTP POST."""
+    try:
+        socket = _ensure_socket(_API_HOST, _API_PORT)
+
+        # Only Content-Length varies; the rest of the header is baked.
+        # The header is written right-aligned against the body so header
+        # and body leave in one send loop over one contiguous buffer -
+        # no header/body segment boundary for Nagle to stall on.
+        request_bytes = _HDR_PREFIX + ("Content-Length: %d\r\n\r\n" % json_len).encode('utf-8')
+        start = _BODY_OFF - len(request_bytes)
+        _JSON_MV[start:_BODY_OFF] = request_bytes
+        total_len = _BODY_OFF + json_len
+
+        pos = start
+        while pos < total_len:
+            sent = socket.send(_JSON_MV[pos:total_len])
+            if sent == 0:
+                raise OSError("Connection broken")
+            pos += sent
+        total_sent = json_len
+
+        # Read the full response into the reused buffer and check the
+        # status code bytes of "HTTP/1.1 200 ..." directly - no decode,
+        # no transient strings, and no false match on '200' elsewhere
         try:
-            socket.settimeout(10.0)
-            socket.connect((host, port))
-            
-            # Prepare HTTP POST request
-            json_bytes = json_data.encode('utf-8')
-            request = f"POST {path} HTTP/1.1\r\n"
-            request += f"Host: {host}:{port}\r\n"
-            request += "Content-Type: application/json\r\n"
-            request += f"Content-Length: {len(json_bytes)}\r\n"
-            request += "Connection: close\r\n"
-            request += "\r\n"
-            
-            # Send request header
-            request_bytes = request.encode('utf-8')
-            total_sent = 0
-            while total_sent < len(request_bytes):
-                sent = socket.send(request_bytes[total_sent:])
-                if sent == 0:
-                    raise OSError("Connection broken")
-                total_sent += sent
-            
-            # Send JSON data in small chunks
-            total_sent = 0
-            chunk_size = 256
-            while total_sent < len(json_bytes):
-                chunk = json_bytes[total_sent:total_sent + chunk_size]
-                sent = socket.send(chunk)
-                if sent == 0:
-                    raise OSError("Connection broken")
-                total_sent += sent
-            
-            # Read response to verify
-            response_buffer = bytearray(512)
-            try:
-                bytes_read = socket.recv_into(response_buffer, 512)
-                # Check if response indicates success (200 OK)
-                response_str = response_buffer[:bytes_read].decode('utf-8', errors='ignore')
-                if '200' in response_str or 'success' in response_str.lower():
-                    return True
-            except:
-                # If we can't read response, assume success if we sent all data
-                if total_sent == len(json_bytes):
-                    return True
-            
-            return False
-        finally:
-            try:
-                socket.close()
-            except:
-                pass
+            bytes_read = _read_response(socket)
+            ok = (bytes_read == -1 or bytes_read >= 12) and _RESP[9:12] == b"200"
+            if bytes_read <= 0:
+                # Overflowed buffer (undrained bytes) or peer closed:
+                # either way start fresh next upload
+                _drop_socket()
+            return ok
+        except:
+            # Response unread: connection state is unknown, so reconnect
+            # next time, but count the upload if every byte was sent
+            _drop_socket()
+            return total_sent == json_len
     except OSError as e:
+        _drop_socket()
         errno = getattr(e, 'errno', None)
         if errno == 113:  # EHOSTUNREACH
             print(f"Upload error: Host unreachable - check IP address")
@@ -186,9 +320,15 @@ def upload_thermal_data(json_data):
             print(f"Upload error: {e} (errno: {errno})")
         return False
     except Exception as e:
+        _drop_socket()
         print(f"Upload error: {e}")
         return False
 
+# Status line templates built once; % formatting fills them without
+# recompiling an f-string template every iteration
+_UPLOAD_FMT = "Upload #%d: %.1f°C - %.1f°C"
+_UPLOAD_FAIL_FMT = "Upload failed: %.1f°C - %.1f°C"
+
 # Main loop
 print(f"Connected to WiFi: {ip_addr}")
 print(f"API server: {API_URL}")
@@ -199,6 +339,7 @@ if mlx is None:
     print("Script will run but no data will be uploaded")
 
 upload_count = 0
+_next_t = time.monotonic()
 while True:
     try:
         if mlx is None:
@@ -206,8 +347,7 @@ while True:
             time.sleep(UPLOAD_INTERVAL)
             continue
         
-        # Read thermal frame
-        gc.collect()
+        # Read thermal frame (written in place into the reused buffer)
         try:
             mlx.getFrame(frame)
         except MemoryError:
@@ -220,31 +360,38 @@ while True:
             time.sleep(UPLOAD_INTERVAL)
             continue
         
-        # Generate JSON
-        gc.collect()
+        # Generate JSON into the reused payload buffer; one fused
+        # min/max pass feeds both the payload and the status print
         try:
-            json_data = generate_thermal_json(frame)
+            min_temp, max_temp = minmax(frame)
+            json_len = generate_thermal_json(frame, min_temp, max_temp)
         except Exception as e:
             print(f"Error generating JSON: {e}")
             time.sleep(UPLOAD_INTERVAL)
             continue
-        
+
         # Upload to API
-        min_temp = min(frame)
-        max_temp = max(frame)
-        if upload_thermal_data(json_data):
+        if upload_thermal_data(json_len):
             upload_count += 1
-            print(f"Upload #{upload_count}: {min_temp:.1f}°C - {max_temp:.1f}°C")
+            print(_UPLOAD_FMT % (upload_count, min_temp, max_temp))
         else:
-            print(f"Upload failed: {min_temp:.1f}°C - {max_temp:.1f}°C")
-        
-        # Clean up
-        del json_data
-        gc.collect()
-        
-        # Wait before next upload
-        time.sleep(UPLOAD_INTERVAL)
-        
+            print(_UPLOAD_FAIL_FMT % (min_temp, max_temp))
+            # Recovery path only: reclaim whatever the failed
+            # send/reconnect attempt left behind
+            gc.collect()
+
+        # Deadline scheduling: sleep until the next slot instead of a
+        # fixed interval after the work, so frame read + upload time no
+        # longer stretches the period - 3 s means 3 s, not 3 s + work
+        _next_t += UPLOAD_INTERVAL
+        _dt = _next_t - time.monotonic()
+        if _dt > 0:
+            time.sleep(_dt)
+        else:
+            # Fell behind (slow upload or retry) - re-anchor the
+            # schedule rather than bursting to catch up
+            _next_t = time.monotonic()
+
     except KeyboardInterrupt:
         print("\nStopped by user")
         break
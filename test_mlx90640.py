@@ -15,8 +15,15 @@ print("time module imported")
 import board
 print("board module imported")
 
-import busio
-print("busio module imported")
+# Import the shared bring-up helpers once at module scope (matches the
+# uploader and lets the port freeze them as bytecode) instead of paying
+# the parse/compile inside main()'s sensor-init step
+try:
+    import mlx_common
+    print("mlx_common module imported")
+except Exception as _e:
+    mlx_common = None
+    print(f"✗ Error importing mlx_common: {_e}")
 
 # Thermal image dimensions
 MLX_SHAPE = (24, 32)  # 24 rows, 32 columns
@@ -35,41 +42,32 @@ def main():
         print(f"   SCL pin: {board.SCL}")
         print(f"   SDA pin: {board.SDA}")
         
-        # Try to create I2C bus
+        # Create the I2C bus through the shared helper (same 1 MHz bus
+        # as the uploader; it falls back to board.I2C() if the pins are
+        # already claimed)
         print("   Creating I2C bus...")
         try:
-            i2c = busio.I2C(board.SCL, board.SDA, frequency=800000)
+            i2c = mlx_common.init_i2c()
             print("   ✓ I2C bus initialized")
         except ValueError as e:
-            error_msg = str(e).lower()
-            if "in use" in error_msg:
+            if "in use" in str(e).lower():
                 print("   ⚠ I2C pins are already in use!")
                 print("   This usually means another script is using I2C (like mlx90640.py)")
                 print("\n   Solutions:")
                 print("   1. Stop the web server (rename mlx90640.py or delete code.py)")
                 print("   2. Or run this test from REPL after stopping the server")
-                print("   3. Or use board.I2C() if available (trying now)...")
-                
-                # Try to use board.I2C() if available
-                try:
-                    if hasattr(board, 'I2C'):
-                        i2c = board.I2C()
-                        print("   ✓ Using board.I2C() instead")
-                    else:
-                        raise ValueError("board.I2C() not available")
-                except:
-                    print("\n   ✗ Cannot initialize I2C. Please stop other I2C-using code first.")
-                    print("   To stop the web server:")
-                    print("     - Delete or rename code.py on CIRCUITPY drive")
-                    print("     - Or press Ctrl+C in REPL if server is running")
-                    raise ValueError("I2C pins in use - stop other code first")
+                print("   To stop the web server:")
+                print("     - Delete or rename code.py on CIRCUITPY drive")
+                print("     - Or press Ctrl+C in REPL if server is running")
+                raise ValueError("I2C pins in use - stop other code first")
             else:
                 raise
         
-        # Scan I2C bus for devices
+        # Scan I2C bus for devices. Sleep briefly while waiting for the
+        # lock instead of spinning the core at full speed
         print("\n   Scanning I2C bus for devices...")
         while not i2c.try_lock():
-            pass
+            time.sleep(0.001)
         try:
             devices = i2c.scan()
             print(f"   Found {len(devices)} I2C device(s):")
@@ -94,20 +92,12 @@ def main():
         return
     
     # Initialize MLX90640 sensor
-    print("\n2. Importing MLX90640 library...")
-    try:
-        import adafruit_mlx90640
-        from adafruit_mlx90640 import RefreshRate
-        print("   ✓ Library imported successfully")
-    except Exception as e:
-        print(f"   ✗ Error importing library: {e}")
-        import sys
-        try:
-            sys.print_exception(e)
-        except:
-            pass
+    print("\n2. Checking MLX90640 library...")
+    if mlx_common is None:
+        print("   ✗ mlx_common failed to import (see startup log)")
         return
-    
+    print("   ✓ Library imported at module load")
+
     print("\n3. Initializing MLX90640 sensor...")
     try:
         print("   Creating MLX90640 object...")
@@ -115,23 +105,19 @@ def main():
         mlx = None
         addresses_to_try = [0x33]  # Default MLX90640 address
         
-        # If default address not found, try scanning
-        while not i2c.try_lock():
-            pass
-        try:
-            devices = i2c.scan()
-            if 0x33 not in devices and len(devices) > 0:
-                print(f"   Default address 0x33 not found, trying detected addresses...")
-                addresses_to_try = devices
-        finally:
-            i2c.unlock()
-        
+        # If default address not found, fall back to the addresses the
+        # step-1 scan already found - the bus hasn't changed since, and
+        # each scan probes over a hundred addresses
+        if 0x33 not in devices and len(devices) > 0:
+            print(f"   Default address 0x33 not found, trying detected addresses...")
+            addresses_to_try = devices
+
         for addr in addresses_to_try:
             try:
                 print(f"   Trying address 0x{addr:02X}...")
                 # Note: adafruit_mlx90640 doesn't support address parameter directly
                 # But we can check if device responds
-                mlx = adafruit_mlx90640.MLX90640(i2c)
+                mlx = mlx_common.init_mlx(i2c)
                 print(f"   ✓ MLX90640 object created")
                 break
             except Exception as e:
@@ -141,15 +127,8 @@ def main():
         if mlx is None:
             raise Exception("Could not initialize MLX90640 at any address")
         
-        print("   Setting refresh rate...")
-        # Try different refresh rates if needed
-        try:
-            mlx.refresh_rate = RefreshRate.REFRESH_8_HZ  # 8Hz refresh rate
-            print(f"   ✓ Refresh rate set to: {mlx.refresh_rate}")
-        except Exception as e:
-            print(f"   ⚠ Could not set refresh rate: {e}")
-            print("   Continuing with default refresh rate...")
-        
+        # init_mlx already set the 8 Hz refresh rate
+        print(f"   ✓ Refresh rate set to: {mlx.refresh_rate}")
         print("   ✓ MLX90640 sensor initialized successfully")
         
         # Try to read sensor serial number or other info if available
@@ -178,45 +157,56 @@ def main():
     frame_count = 0
     consecutive_errors = 0
     max_consecutive_errors = 5
-    
+
+    # The center pixel and the 4x4 sample window never move, so compute
+    # their flat indices once here instead of redoing the row/column
+    # arithmetic (and building throwaway f-strings) on every frame
+    center_idx = (MLX_SHAPE[0] // 2) * MLX_SHAPE[1] + (MLX_SHAPE[1] // 2)
+    start_row = MLX_SHAPE[0] // 2 - 2
+    start_col = MLX_SHAPE[1] // 2 - 2
+    center_idxs = [
+        tuple((start_row + row) * MLX_SHAPE[1] + start_col + col
+              for col in range(4))
+        for row in range(4)
+    ]
+    row_fmt = "    %5.1f %5.1f %5.1f %5.1f"
+
     try:
         while True:
             try:
                 # Read a frame from the sensor
-                print(f"   Attempting to read frame #{frame_count + 1}...", end=" ")
                 mlx.getFrame(frame)
-                print("✓")
                 frame_count += 1
                 consecutive_errors = 0  # Reset error counter on success
-                
-                # Calculate statistics
-                min_temp = min(frame)
-                max_temp = max(frame)
+
+                # Calculate statistics (single-pass min/max from mlx_common)
+                min_temp, max_temp = mlx_common.minmax(frame)
                 avg_temp = sum(frame) / len(frame)
-                
+
                 # Find center temperature
-                center_idx = (MLX_SHAPE[0] // 2) * MLX_SHAPE[1] + (MLX_SHAPE[1] // 2)
                 center_temp = frame[center_idx]
-                
-                # Display results
-                print(f"Frame #{frame_count}:")
-                print(f"  Min: {min_temp:.2f}°C")
-                print(f"  Max: {max_temp:.2f}°C")
-                print(f"  Avg: {avg_temp:.2f}°C")
-                print(f"  Center: {center_temp:.2f}°C")
-                
-                # Display a small sample of the frame (4x4 center area)
-                print("  Sample (4x4 center area):")
-                start_row = MLX_SHAPE[0] // 2 - 2
-                start_col = MLX_SHAPE[1] // 2 - 2
-                for row in range(4):
-                    row_data = []
-                    for col in range(4):
-                        idx = (start_row + row) * MLX_SHAPE[1] + (start_col + col)
-                        row_data.append(f"{frame[idx]:5.1f}")
-                    print(f"    {' '.join(row_data)}")
-                
-                print()
+
+                # Assemble the whole report and emit it with one print:
+                # each print() is a separate UART write+flush, and dozens
+                # per frame ate a real slice of the 1 s frame budget
+                lines = [
+                    f"   Read frame #{frame_count} ✓",
+                    f"Frame #{frame_count}:",
+                    f"  Min: {min_temp:.2f}°C",
+                    f"  Max: {max_temp:.2f}°C",
+                    f"  Avg: {avg_temp:.2f}°C",
+                    f"  Center: {center_temp:.2f}°C",
+                    "  Sample (4x4 center area):",
+                ]
+
+                # Collect a small sample of the frame (4x4 center area)
+                # using the precomputed indices - one % format per row
+                for i0, i1, i2, i3 in center_idxs:
+                    lines.append(row_fmt % (frame[i0], frame[i1],
+                                            frame[i2], frame[i3]))
+
+                lines.append("")
+                print('\n'.join(lines))
                 time.sleep(1)  # Wait 1 second between frames
                 
             except Exception as e:
@@ -0,0 +1,13 @@
+"""WSGI entry point for running the API server under a production server.
+
+`python3 api_server.py` already serves through waitress; this module is
+for external WSGI servers, e.g.:
+
+    waitress-serve --host 0.0.0.0 --port 5000 wsgi:app
+    gunicorn -k gthread -w 1 --threads 8 -b 0.0.0.0:5000 wsgi:app
+
+Keep workers at 1: the latest-frame cache, occupancy stats, and the
+background disk writer live in process memory.
+"""
+
+from api_server import app  # noqa: F401